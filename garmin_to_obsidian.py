@@ -1,21 +1,83 @@
 import argparse
+import io
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-from dotenv import load_dotenv
-from garminconnect import Garmin
-
-# --- Load environment variables ---
-load_dotenv()
-
-OBS_PATH = os.getenv("OBS_PATH")  # Path to Obsidian Journal
-email = os.getenv("GARMIN_EMAIL")
-password = os.getenv("GARMIN_PASSWORD")
-
-# --- Authenticate Garmin API ---
-client = Garmin(email, password)
-client.login()
+# --- Environment and Garmin API client (loaded on first use) ---
+_env_loaded = False
+_client = None
+_client_lock = threading.Lock()
+
+# --- Sleep summary cache (keyed by YYYY-MM-DD) ---
+_sleep_cache = {}
+
+# --- Obsidian log templates per activity type ---
+_ENTRY_PREFIX = "{start_time}\n- [ ] {name} #log/exercise/{activity_type}"
+_EXERCISE_TEMPLATES = {
+    "running": _ENTRY_PREFIX
+    + " #distance/{distance}km #duration/{duration}min #avgPace/{avg_pace}min/km #avgHR/{avg_hr}bpm #calories/{calories}",
+    "lacrosse": _ENTRY_PREFIX
+    + " #distance/{distance}km #duration/{duration}min #avgHR/{avg_hr}bpm #calories/{calories}",
+    "yoga": _ENTRY_PREFIX
+    + " #duration/{duration}min #avgHR/{avg_hr}bpm #calories/{calories}",
+    "strength_training": _ENTRY_PREFIX
+    + " #sets/{sets} #duration/{duration}min #avgHR/{avg_hr}bpm #calories/{calories}",
+}
+_DEFAULT_EXERCISE_TEMPLATE = (
+    _ENTRY_PREFIX + " #duration/{duration}min #calories/{calories}"
+)
+
+
+def load_env():
+    """Load variables from .env once; deferred so --help and bad args stay fast."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_client():
+    """Return an authenticated Garmin client, reusing cached session tokens."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # Heavy imports (garth, requests, cryptography) only when needed
+            from garminconnect import Garmin
+            from garth.exc import GarthHTTPError
+
+            load_env()
+            tokenstore = os.path.expanduser(
+                os.getenv("GARMINTOKENS", "~/.garminconnect")
+            )
+            # GARMINTOKENS may also hold a base64 token string (>512 chars),
+            # which can be loaded but not dumped to
+            is_path = len(tokenstore) <= 512
+            tokendir = tokenstore if is_path else os.path.expanduser("~/.garminconnect")
+            client = Garmin()
+            try:
+                client.login(tokenstore)
+            except (FileNotFoundError, GarthHTTPError):
+                # No usable tokens: do a full SSO login and cache the new tokens.
+                # Garmin.login() without a path would fall back to GARMINTOKENS
+                # and retry the same token store, so go through garth directly.
+                print("🤖 Logging in to Garmin Connect")
+                client = Garmin()
+                client.garth.login(
+                    os.getenv("GARMIN_EMAIL"), os.getenv("GARMIN_PASSWORD")
+                )
+                client.garth.dump(tokendir)
+                client.login(tokendir)  # populates display_name
+            else:
+                # Persist the OAuth2 token in case it was refreshed during login
+                if is_path:
+                    client.garth.dump(tokenstore)
+            _client = client
+    return _client
 
 
 def parse_date(date_str):
@@ -42,7 +104,9 @@ def format_time(timestamp):
     """Convert Garmin timestamp (milliseconds) to HH:MM format."""
     if not timestamp:
         return "N/A"
-    return datetime.fromtimestamp(timestamp / 1000).strftime("%H:%M")
+    # Garmin's *Local timestamps already encode wall-clock time, so no tz shift
+    minutes = int(timestamp) // 60000
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
 
 
 def format_hours(seconds):
@@ -59,6 +123,9 @@ def format_obsidian_tag(value):
 
 def format_timestamp(timestamp):
     """Convert ISO 8601 timestamps (YYYY-MM-DDTHH:MM:SS.sss) to HH:MM format."""
+    # Fast path: Garmin's fixed-width format has HH:MM at characters 11-16
+    if isinstance(timestamp, str) and len(timestamp) >= 16 and timestamp[10] == "T":
+        return timestamp[11:16]
     try:
         parsed_time = datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%f")
         return parsed_time.strftime("%H:%M")
@@ -66,10 +133,32 @@ def format_timestamp(timestamp):
         return "N/A"
 
 
+def get_sleep_summary(date_str):
+    """Fetch the daily sleep summary without the per-minute detail arrays."""
+    if date_str in _sleep_cache:
+        return _sleep_cache[date_str]
+
+    client = get_client()
+    url = f"/wellness-service/wellness/dailySleepData/{client.display_name}"
+    params = {
+        "date": date_str,
+        "nonSleepBufferMinutes": 0,
+        "includeSleepLevels": "false",
+        "includeSpO2": "false",
+        "includeRespiration": "false",
+        "includeHrv": "false",
+        "includeMovement": "false",
+    }
+    response = client.connectapi(url, params=params) or {}
+
+    sleep_data = response.get("dailySleepDTO") or {}
+    _sleep_cache[date_str] = sleep_data
+    return sleep_data
+
+
 def get_sleep_data(date_str):
     # --- Fetch Sleep Data ---
-    print(f"🤖 Fetching Garmin Sleep Data for {date_str}")
-    sleep_data = client.get_sleep_data(date_str).get("dailySleepDTO", {})
+    sleep_data = get_sleep_summary(date_str)
 
     quality = (
         sleep_data.get("sleepScores", {}).get("overall", {}).get("qualifierKey", "N/A")
@@ -88,47 +177,34 @@ def get_sleep_data(date_str):
 
 def get_exercise_logs(date_str):
     # --- Fetch Activity Data ---
-    print(f"\n🤖 Fetching Garmin activities for {date_str}")
-    activities = client.get_activities_fordate(date_str)
+    activities = get_client().get_activities_fordate(date_str)
 
     exercise_logs = []
     for activity in activities["ActivitiesForDay"]["payload"]:
-        activity_type = (
-            activity.get("activityType", {}).get("typeKey", "unknown").lower()
-        )
-        name = activity.get("activityName", "Unnamed Activity")
-        distance = format_obsidian_tag(
-            activity.get("distance", 0) / 1000
-        )  # Convert meters to km
-        duration = format_obsidian_tag(
-            activity.get("duration", 0) / 60
-        )  # Convert seconds to minutes
-        start_time = format_timestamp(activity.get("startTimeGMT", None))
-        avg_hr = format_obsidian_tag(activity.get("averageHR", "N/A"))
-        calories = format_obsidian_tag(activity.get("calories", "N/A"))
-
-        # Handle activity-specific metrics
+        get = activity.get
+        activity_type = (get("activityType") or {}).get("typeKey", "unknown").lower()
+
+        fields = {
+            "activity_type": activity_type,
+            "name": get("activityName", "Unnamed Activity"),
+            "distance": format_obsidian_tag(get("distance", 0) / 1000),  # m -> km
+            "duration": format_obsidian_tag(get("duration", 0) / 60),  # s -> min
+            "start_time": format_timestamp(get("startTimeGMT", None)),
+            "avg_hr": format_obsidian_tag(get("averageHR", "N/A")),
+            "calories": format_obsidian_tag(get("calories", "N/A")),
+        }
+
+        # Activity-specific metrics, only for the templates that use them
         if activity_type == "running":
-            avg_pace = activity.get("averageSpeed", 0)
-            avg_pace = (
-                format_obsidian_tag(1000 / (avg_pace * 60)) if avg_pace > 0 else "N/A"
+            avg_speed = get("averageSpeed") or 0
+            fields["avg_pace"] = (
+                format_obsidian_tag(1000 / (avg_speed * 60)) if avg_speed > 0 else "N/A"
             )  # Convert m/s to min/km
-            log_entry = f"{start_time}\n- [ ] {name} #log/exercise/{activity_type} #distance/{distance}km #duration/{duration}min #avgPace/{avg_pace}min/km #avgHR/{avg_hr}bpm #calories/{calories}"
-
-        elif activity_type == "lacrosse":
-            log_entry = f"{start_time}\n- [ ] {name} #log/exercise/{activity_type} #distance/{distance}km #duration/{duration}min #avgHR/{avg_hr}bpm #calories/{calories}"
-
-        elif activity_type == "yoga":
-            log_entry = f"{start_time}\n- [ ] {name} #log/exercise/{activity_type} #duration/{duration}min #avgHR/{avg_hr}bpm #calories/{calories}"
-
         elif activity_type == "strength_training":
-            sets = format_obsidian_tag(activity.get("activeSets", "N/A"))
-            log_entry = f"{start_time}\n- [ ] {name} #log/exercise/{activity_type} #sets/{sets} #duration/{duration}min #avgHR/{avg_hr}bpm #calories/{calories}"
-
-        else:
-            log_entry = f"{start_time}\n- [ ] {name} #log/exercise/{activity_type} #duration/{duration}min #calories/{calories}"
+            fields["sets"] = format_obsidian_tag(get("activeSets", "N/A"))
 
-        exercise_logs.append(log_entry)
+        template = _EXERCISE_TEMPLATES.get(activity_type, _DEFAULT_EXERCISE_TEMPLATE)
+        exercise_logs.append(template.format_map(fields))
 
     return exercise_logs
 
@@ -137,7 +213,17 @@ def get_note_path(date_str, parsed_date):
     # --- Define Obsidian daily note path ---
     year = parsed_date.strftime("%Y")
     month = parsed_date.strftime("%m")
-    return os.path.expanduser(f"{OBS_PATH}/{year}/{month}/{date_str}.md")
+    load_env()
+    obs_path = os.getenv("OBS_PATH")  # Path to Obsidian Journal
+    return os.path.expanduser(f"{obs_path}/{year}/{month}/{date_str}.md")
+
+
+def find_line_end(content, line):
+    """Return the offset just past the first full-line match of `line`, or -1."""
+    index = content.find(line)
+    while index > 0 and content[index - 1] != "\n":
+        index = content.find(line, index + 1)
+    return index + len(line) if index != -1 else -1
 
 
 def append_to_obsidian(exercise_logs, sleep_logs, note_path):
@@ -147,33 +233,49 @@ def append_to_obsidian(exercise_logs, sleep_logs, note_path):
     # Read existing note content (or create new)
     if os.path.exists(note_path):
         with open(note_path, "r", encoding="utf-8") as file:
-            note_content = file.readlines()
+            note_content = file.read()
     else:
-        note_content = []
+        note_content = ""
 
-    # --- Insert Sleep Logs ---
-    try:
-        log_index = note_content.index("> [!log-morning]- Log Morning\n") + 1
-    except ValueError:
-        note_content.append("\n> [!log-morning]- Log Morning\n")
-        log_index = len(note_content)
+    sleep_marker = "> [!log-morning]- Log Morning\n"
+    exercise_marker = "### 👟 Exercise\n"
+    sleep_block = "\n".join(sleep_logs) + "\n"
+    exercise_block = "\n".join(exercise_logs) + "\n"
 
+    # Collect (offset, text) insertions; missing sections go at the end
+    inserts = []
+    tail = []
+
+    # --- Insert Sleep Logs ---
+    sleep_index = find_line_end(note_content, sleep_marker)
+    if sleep_index == -1:
+        tail.append("\n" + sleep_marker + sleep_block)
+    else:
+        inserts.append((sleep_index, sleep_block))
     print("🤖 Adding sleep logs to daily note")
-    note_content.insert(log_index, "\n".join(sleep_logs) + "\n")
 
     # --- Insert Exercise Logs ---
-    try:
-        exercise_index = note_content.index("### 👟 Exercise\n") + 1
-    except ValueError:
-        note_content.append("\n### 👟 Exercise\n")
-        exercise_index = len(note_content)
-
+    exercise_index = find_line_end(note_content, exercise_marker)
+    if exercise_index == -1:
+        tail.append("\n" + exercise_marker + exercise_block)
+    else:
+        inserts.append((exercise_index, exercise_block))
     print("🤖 Adding exercise logs to daily note")
-    note_content.insert(exercise_index, "\n".join(exercise_logs) + "\n")
+
+    # --- Build the new note in a single pass ---
+    buffer = io.StringIO()
+    position = 0
+    for index, text in sorted(inserts, key=lambda insert: insert[0]):
+        buffer.write(note_content[position:index])
+        buffer.write(text)
+        position = index
+    buffer.write(note_content[position:])
+    for text in tail:
+        buffer.write(text)
 
     # --- Write Back to File ---
-    with open(note_path, "w", encoding="utf-8") as file:
-        file.writelines(note_content)
+    with open(note_path, "w", encoding="utf-8", buffering=65536) as file:
+        file.write(buffer.getvalue())
 
     print(f"🤖 ✅ Workout and sleep data added to {note_path}")
 
@@ -201,8 +303,18 @@ def main():
         sys.exit(1)
 
     date_str, parsed_date = parse_date(args.date)
-    sleep_logs = get_sleep_data(date_str)
-    exercise_logs = get_exercise_logs(date_str)
+    # Authenticate once up front so a failed login isn't retried by each worker
+    get_client()
+
+    print(f"🤖 Fetching Garmin Sleep Data for {date_str}")
+    print(f"🤖 Fetching Garmin activities for {date_str}")
+
+    # Sleep and activity requests are independent, so run them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        sleep_future = executor.submit(get_sleep_data, date_str)
+        exercise_future = executor.submit(get_exercise_logs, date_str)
+        sleep_logs = sleep_future.result()
+        exercise_logs = exercise_future.result()
 
     if not exercise_logs or not sleep_logs:
         print(f"🤖 ❌ No data found for {date_str}.")